@@ -6,50 +6,216 @@ Automatically generates and maintains dynamic inventory from Hetzner API
 """
 
 from flask import Flask, request, jsonify
+from flask.json.provider import DefaultJSONProvider
 import subprocess
+import tempfile
 import threading
 import yaml
 import json
 import os
+import re
+import ipaddress
+import signal
+import shutil
 import time
-from datetime import datetime
 from pathlib import Path
 import logging
 from logging.handlers import RotatingFileHandler
-from queue import Queue
+from collections import deque
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 import hcloud
 
+# Prefer the libyaml C bindings, fall back to the pure-Python implementation
+try:
+    from yaml import CSafeLoader as SafeLoader, CSafeDumper as SafeDumper
+except ImportError:
+    from yaml import SafeLoader, SafeDumper
+
+# orjson serializes large responses much faster than the stdlib encoder, if available
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# The Kubernetes client keeps one HTTPS connection pool instead of forking kubectl per call, if available
+try:
+    from kubernetes import client as k8s_client, config as k8s_config
+    from kubernetes.client.rest import ApiException
+except ImportError:
+    k8s_client = None
+
+
+class ORJSONProvider(DefaultJSONProvider):
+    """JSON provider that serializes with orjson, which is much faster on large payloads"""
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=self.default, option=orjson.OPT_NON_STR_KEYS).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+
 app = Flask(__name__)
+if orjson is not None:
+    app.json = ORJSONProvider(app)
 
 # Configuration
 KUBESPRAY_DIR = "/root/tf-k8s-cluster-1/kubespray"
 INVENTORY_FILE = f"{KUBESPRAY_DIR}/inventory/mycluster/hosts.yaml"
+STATE_DIR = "/var/lib/kubespray-api"  # Private (0700) state of the API, such as credentials
+# Outside inventory/mycluster/, where Ansible would load it as another inventory source
+INVENTORY_SIDECAR = f"{STATE_DIR}/hosts.yaml.json"  # Parsed copy of INVENTORY_FILE, tagged with the version it came from
+INVENTORY_BACKUP_COUNT = 5  # Rotated backups kept besides hosts.yaml.backup
 VENV_ANSIBLE = f"{KUBESPRAY_DIR}/.venv/bin/ansible-playbook"
 SCALE_PLAYBOOK = f"{KUBESPRAY_DIR}/scale.yml"
+ANSIBLE_TIMEOUT = 1800  # 30 minute timeout
+ANSIBLE_OUTPUT_TAIL_LINES = 200  # Lines of playbook output kept for the job message
+# Same meaning as Ansible's own setting: 0 (default) .. 4, or the flag form (-v .. -vvvv); anything else is 0
+_verbosity = (os.environ.get('ANSIBLE_VERBOSITY') or '').strip()
+if _verbosity.isdigit():
+    ANSIBLE_VERBOSITY = int(_verbosity)
+elif re.fullmatch(r'-?v+', _verbosity):
+    ANSIBLE_VERBOSITY = _verbosity.count('v')
+else:
+    ANSIBLE_VERBOSITY = 0
+ANSIBLE_BATCH_SIZE = 20  # Max queued nodes provisioned by a single playbook run
+# Environment for ansible-playbook, built once; pipelining cuts SSH round-trips per task
+# ANSIBLE_VERBOSITY is left out: Ansible adds each -v to it, so passing both would double the level
+_ANSIBLE_ENV = {
+    **{k: v for k, v in os.environ.items() if k != 'ANSIBLE_VERBOSITY'},
+    'ANSIBLE_STDOUT_CALLBACK': 'default',
+    'ANSIBLE_PIPELINING': 'True'
+}
+KUBECTL = "kubectl"
+KUBECTL_REQUEST_TIMEOUT = "10s"  # Per API request, so kubectl fails fast when the apiserver is unreachable
+KUBECTL_KUBECONFIG = f"{STATE_DIR}/kubeconfig"  # Minified copy of the kubeconfig used by kubectl calls
+KUBECTL_KUBECONFIG_TTL = 300  # Seconds before the minified kubeconfig is resolved again
+# kubectl errors meaning the minified copy holds stale credentials
+_KUBECTL_AUTH_ERROR_RE = re.compile(r'Unauthorized|must be logged in|x509|certificate', re.IGNORECASE)
+NODE_READY_TIMEOUT = 60  # Seconds to wait for a provisioned node to report Ready
+DRAIN_TIMEOUT = 120  # Seconds to wait for pods to be evicted from a removed node
+NODE_CACHE_TTL = 2.0  # Seconds a node read through the API client is reused
+K8S_REQUEST_TIMEOUT = 10  # Seconds per Kubernetes API request, matching KUBECTL_REQUEST_TIMEOUT
+K8S_CONFIG_RETRY = 60  # Seconds before retrying a Kubernetes config that failed to load
+JOB_TTL = 24 * 60 * 60  # Seconds a finished job stays queryable via /status
+JOB_MAX = 500  # Finished jobs beyond this many are evicted oldest-first
+JOB_LOG_DIR = "/var/log/kubespray-api/jobs"  # Playbook output of finished jobs
 LOG_FILE = "/var/log/kubespray-api/kubespray-api.log"
 LOG_MAX_BYTES = 10 * 1024 * 1024  # 10MB
 LOG_BACKUP_COUNT = 5
+LOG_TAIL_CHUNK = 64 * 1024  # Bytes read per step when tailing the log backwards
+LOG_TAIL_MAX_LINES = 10000  # Upper bound for /logs?lines=
 
 # Hetzner configuration
 HCLOUD_TOKEN = os.environ.get('HCLOUD_TOKEN')
 HCLOUD_NETWORK_ID = int(os.environ.get('HCLOUD_NETWORK', 0))
 AUTOSCALER_LABEL = 'hcloud/node-group=apps'  # Label for autoscaled nodes
 
+# Hostnames accepted by /add-node, and names Ansible treats as patterns rather than hosts
+_HOSTNAME_RE = re.compile(r'^[a-z0-9][a-z0-9.-]*$')
+_RESERVED_HOSTNAMES = frozenset(('all', 'ungrouped', 'localhost'))
+
+# Hostname prefixes and the inventory role they map to
+_PREFIX_TO_GROUP = (('apps-', 'apps'), ('master-', 'master'), ('worker-', 'worker'))
+HCLOUD_PAGE_SIZE = 50  # Maximum page size allowed by the Hetzner API
+HCLOUD_FETCH_WORKERS = 4  # Parallel page fetches when listing servers
+HCLOUD_SERVERS_TTL = 60  # Seconds to reuse the autoscaled server list
+
+class RWLock:
+    """Readers-writer lock: concurrent readers, exclusive writers, waiting writers go first"""
+    
+    def __init__(self):
+        self._cond = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writer = False
+        self._writers_waiting = 0
+    
+    @contextmanager
+    def read_lock(self):
+        with self._cond:
+            while self._writer or self._writers_waiting:
+                self._cond.wait()
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._readers -= 1
+                if not self._readers:
+                    self._cond.notify_all()
+    
+    @contextmanager
+    def write_lock(self):
+        with self._cond:
+            self._writers_waiting += 1
+            while self._writer or self._readers:
+                self._cond.wait()
+            self._writers_waiting -= 1
+            self._writer = True
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._writer = False
+                self._cond.notify_all()
+
+
 # Job tracking
 jobs = {}
 job_lock = threading.Lock()
 
-# Ansible job queue for serializing playbook runs
-ansible_queue = Queue()
-queue_lock = threading.Lock()
+# (finish time, job_id) of finished jobs in completion order, for expiry
+finished_jobs = deque()
+
+# Jobs waiting for a playbook run, guarded by job_lock
+pending_jobs = []
+# A single worker serializes playbook runs
+ansible_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='AnsibleWorker')
+
+# Serializes rotation of the inventory backups
+backup_lock = threading.Lock()
+_stray_backups_pruned = False  # Guarded by backup_lock
 
-# Inventory update lock to prevent concurrent modifications
+# Inventory update lock to serialize read-modify-write cycles between writers
 inventory_lock = threading.Lock()
 
+# Guards the inventory file swap and cache; readers share it, writers hold it only to publish
+inventory_rwlock = RWLock()
+
+# Parsed inventory cache, keyed on the file's (mtime, size, inode)
+_inv_cache = {'stat': None, 'data': None}
+
+# Autoscaled server list from Hetzner, reused for HCLOUD_SERVERS_TTL seconds
+_servers_cache = {'t': 0, 'data': []}
+servers_cache_lock = threading.Lock()
+
+# Shared CoreV1Api once a config loaded, and when loading last failed, see _k8s_core()
+_k8s_core_cache = {'core': None, 'failed_at': None}
+k8s_core_lock = threading.Lock()
+
+# Environment for kubectl calls and when it was resolved, see _kubectl_env()
+_kubectl_env_cache = {'t': None, 'env': None}
+kubectl_env_lock = threading.Lock()
+
+# hostname -> (monotonic fetch time, V1Node or None if absent), see _get_node()
+_node_cache = {}
+node_cache_lock = threading.Lock()
+
+# (epoch second, formatted timestamp) for now_iso()
+_ts_cache = (0, '')
+
+# (timestamp, encoded body) of the last /health response
+_health_cache = ('', b'')
+
 # Setup logging with rotating file handler
 log_dir = os.path.dirname(LOG_FILE)
 if not os.path.exists(log_dir):
     os.makedirs(log_dir, exist_ok=True)
+os.makedirs(JOB_LOG_DIR, exist_ok=True)
+os.makedirs(STATE_DIR, mode=0o700, exist_ok=True)
+os.chmod(STATE_DIR, 0o700)  # makedirs leaves an existing directory's mode alone
 
 # Create logger
 logger = logging.getLogger(__name__)
@@ -84,6 +250,252 @@ flask_logger.addHandler(file_handler)
 flask_logger.addHandler(console_handler)
 
 
+def now_iso():
+    """Current UTC time as an ISO 8601 string, formatted at most once per second"""
+    global _ts_cache
+    t = int(time.time())
+    cached = _ts_cache
+    if cached[0] != t:
+        cached = (t, time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(t)))
+        _ts_cache = cached
+    return cached[1]
+
+
+@lru_cache(maxsize=4096)
+def _classify(hostname):
+    """Return the group a hostname belongs to by prefix, or 'other'"""
+    for prefix, group in _PREFIX_TO_GROUP:
+        if hostname.startswith(prefix):
+            return group
+    return 'other'
+
+
+def _bucket_hosts(hostnames):
+    """Group hostnames by their prefix (master, worker, apps, other) in a single pass"""
+    buckets = {'master': [], 'worker': [], 'apps': [], 'other': []}
+    for hostname in hostnames:
+        buckets[_classify(hostname)].append(hostname)
+    return buckets
+
+
+def _host_vars(ip):
+    """Inventory host entry for a node reachable at ip"""
+    return {
+        'ansible_host': ip,
+        'ip': ip,
+        'access_ip': ip,
+        'ansible_user': 'root',
+        'ansible_shell_executable': '/bin/bash'
+    }
+
+
+def _yload(stream):
+    """Parse YAML using the fastest available safe loader"""
+    return yaml.load(stream, Loader=SafeLoader)
+
+
+def _ydump(data, stream=None):
+    """Serialize YAML in inventory format using the fastest available safe dumper"""
+    return yaml.dump(data, stream, Dumper=SafeDumper, default_flow_style=False, sort_keys=False)
+
+
+# Strings that may be emitted as plain YAML scalars, subject to the resolver check below
+_PLAIN_SCALAR_RE = re.compile(r'^[A-Za-z0-9_./][A-Za-z0-9_./-]*$')
+_yaml_resolver = yaml.resolver.Resolver()
+# Characters json.dumps(ensure_ascii=False) leaves raw that YAML treats as line breaks or rejects
+_YAML_UNSAFE_CHARS_RE = re.compile('[\x7f-\x9f\u2028\u2029\ufeff\ufffe\uffff\ud800-\udfff]')
+
+
+@lru_cache(maxsize=4096)
+def _yaml_str(value):
+    """Render a string as a YAML scalar, quoting it only if it would not load back as the same string"""
+    if (_PLAIN_SCALAR_RE.match(value)
+            and _yaml_resolver.resolve(yaml.ScalarNode, value, (True, False)) == 'tag:yaml.org,2002:str'):
+        return value
+    # A JSON string is a valid YAML double-quoted scalar. Keep non-ASCII raw: ASCII-only JSON writes
+    # astral characters as surrogate pairs, which YAML loads back as two lone surrogates
+    quoted = _YAML_UNSAFE_CHARS_RE.sub(lambda m: '\\u%04x' % ord(m.group()), json.dumps(value, ensure_ascii=False))
+    # Never publish something that doesn't load back; TypeError makes _emit_inventory use the PyYAML dumper
+    try:
+        if _yload(quoted) == value:
+            return quoted
+    except yaml.YAMLError:
+        pass
+    raise TypeError(f"cannot quote {value!r} as a YAML scalar")
+
+
+def _yaml_scalar(value):
+    """Render a leaf value of the inventory as a YAML scalar"""
+    if value is None:
+        return 'null'
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    if isinstance(value, int):
+        return str(value)
+    if isinstance(value, str):
+        return _yaml_str(value)
+    if isinstance(value, dict) and not value:
+        return '{}'
+    raise TypeError(f"Unsupported inventory value: {type(value).__name__}")
+
+
+def _emit_mapping(mapping, indent, lines):
+    """Append block-style YAML lines for a mapping of scalars and nested mappings"""
+    pad = '  ' * indent
+    for key, value in mapping.items():
+        if not isinstance(key, str):
+            raise TypeError(f"Unsupported inventory key: {type(key).__name__}")
+        if isinstance(value, dict) and value:
+            lines.append(f"{pad}{_yaml_str(key)}:\n")
+            _emit_mapping(value, indent + 1, lines)
+        else:
+            lines.append(f"{pad}{_yaml_str(key)}: {_yaml_scalar(value)}\n")
+
+
+def _emit_inventory(inventory):
+    """Render the inventory as YAML, falling back to the PyYAML dumper for anything but nested mappings of scalars"""
+    lines = []
+    try:
+        _emit_mapping(inventory, 0, lines)
+    except TypeError:
+        return _ydump(inventory)
+    return ''.join(lines) if lines else '{}\n'
+
+
+def _inventory_stat():
+    """Identify the current inventory file version by mtime, size and inode"""
+    st = os.stat(INVENTORY_FILE)
+    return st.st_mtime_ns, st.st_size, st.st_ino
+
+
+def _load_inventory_file(stat):
+    """Parse the inventory file, preferring the JSON sidecar when it was written for this version"""
+    if orjson is not None:
+        try:
+            with open(INVENTORY_SIDECAR, 'rb') as f:
+                cached = orjson.loads(f.read())
+            if tuple(cached['stat']) == stat:
+                return cached['inventory']
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable inventory sidecar: {str(e)}")
+    
+    with open(INVENTORY_FILE, 'r') as f:
+        inventory = _yload(f)
+    
+    _write_sidecar(stat, inventory)
+    return inventory
+
+
+def _write_sidecar(stat, inventory):
+    """Store the parsed inventory for file version `stat` in the JSON sidecar (best effort)"""
+    if orjson is None:
+        return
+    tmp_file = f"{INVENTORY_SIDECAR}.tmp.{os.getpid()}.{threading.get_ident()}"
+    try:
+        # No default and passthrough datetimes: anything JSON can't round-trip raises instead of being coerced
+        data = orjson.dumps({'stat': stat, 'inventory': inventory}, option=orjson.OPT_PASSTHROUGH_DATETIME)
+        with open(tmp_file, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_file, INVENTORY_SIDECAR)
+    except Exception as e:
+        logger.warning(f"Failed to write inventory sidecar: {str(e)}")
+        try:
+            os.remove(tmp_file)
+        except FileNotFoundError:
+            pass
+
+
+def _inventory_snapshot():
+    """Return (file version, shared parsed inventory), re-parsing only when the file changed on disk"""
+    with inventory_rwlock.read_lock():
+        stat = _inventory_stat()
+        if _inv_cache['data'] is None or _inv_cache['stat'] != stat:
+            _inv_cache['data'] = _load_inventory_file(stat)
+            _inv_cache['stat'] = stat
+        return _inv_cache['stat'], _inv_cache['data']
+
+
+def _read_inventory():
+    """Return the parsed inventory (shared with the cache, must not be mutated)"""
+    return _inventory_snapshot()[1]
+
+
+def _stage_inventory(inventory):
+    """Serialize the inventory to a per-thread temp file next to the real one and return its path"""
+    # Same directory so the later os.replace() is an atomic rename
+    tmp_file = f"{INVENTORY_FILE}.tmp.{os.getpid()}.{threading.get_ident()}"
+    # Render once in memory and write the bytes straight to the fd, skipping the text I/O layer
+    data = memoryview(_emit_inventory(inventory).encode())
+    fd = os.open(tmp_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o666)
+    try:
+        try:
+            # Carry over the current file's permissions, which the umask-based 0o666 would otherwise reset
+            try:
+                os.fchmod(fd, os.stat(INVENTORY_FILE).st_mode & 0o7777)
+            except FileNotFoundError:
+                pass
+            while data:
+                data = data[os.write(fd, data):]
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+    except BaseException:
+        # Don't leave a partial file (e.g. after ENOSPC) in the inventory directory
+        _discard_staged(tmp_file)
+        raise
+    return tmp_file
+
+
+def _discard_staged(tmp_file):
+    """Remove a staged inventory that won't be published"""
+    try:
+        os.remove(tmp_file)
+    except FileNotFoundError:
+        pass
+
+
+def _publish_inventory(tmp_file, inventory, expected_stat=None):
+    """Swap a staged inventory into place and refresh the cache, unless the file no longer matches expected_stat"""
+    # Only the swap itself excludes readers
+    with inventory_rwlock.write_lock():
+        if expected_stat is not None:
+            # Check the file itself: an external edit doesn't go through the cache
+            try:
+                unchanged = _inventory_stat() == expected_stat
+            except OSError:
+                unchanged = False
+            if not unchanged:
+                _discard_staged(tmp_file)
+                return False
+        try:
+            os.replace(tmp_file, INVENTORY_FILE)
+        except BaseException:
+            _discard_staged(tmp_file)
+            raise
+        # Cache the dict just written rather than re-parsing it
+        stat = _inventory_stat()
+        _inv_cache['stat'] = stat
+        _inv_cache['data'] = inventory
+    
+    # Tag the sidecar with the new version too, so a restart doesn't re-parse the YAML
+    _write_sidecar(stat, inventory)
+    
+    # Make the rename itself durable, without holding readers off for the flush
+    dir_fd = os.open(os.path.dirname(INVENTORY_FILE), os.O_RDONLY)
+    try:
+        os.fsync(dir_fd)
+    finally:
+        os.close(dir_fd)
+    return True
+
+
+def _write_inventory(inventory):
+    """Atomically replace the inventory file and refresh the cache (caller holds inventory_lock)"""
+    _publish_inventory(_stage_inventory(inventory), inventory)
+
+
 class JobStatus:
     PENDING = "pending"
     QUEUED = "queued"
@@ -100,12 +512,44 @@ class HetznerInventoryManager:
         self.network_id = network_id
         self.logger = logger
     
+    def _get_servers_page(self, page):
+        """Fetch a single page of autoscaled servers"""
+        return self.client.servers.get_list(
+            label_selector=AUTOSCALER_LABEL,
+            page=page,
+            per_page=HCLOUD_PAGE_SIZE
+        )
+    
+    @staticmethod
+    def invalidate():
+        """Drop the cached server list so the next call hits the Hetzner API"""
+        with servers_cache_lock:
+            _servers_cache['t'] = 0
+    
     def get_autoscaled_servers(self):
         """Get all servers with autoscaler label"""
+        with servers_cache_lock:
+            if _servers_cache['t'] and time.monotonic() - _servers_cache['t'] < HCLOUD_SERVERS_TTL:
+                return _servers_cache['data']
+        
         try:
-            # Get all servers with the autoscaler label
-            servers_list = self.client.servers.get_all(label_selector=AUTOSCALER_LABEL)
+            # The first page tells us how many pages there are; fetch the rest in parallel
+            first = self._get_servers_page(1)
+            servers_list = list(first.servers)
+            
+            pagination = first.meta.pagination if first.meta else None
+            last_page = pagination.last_page if pagination and pagination.last_page else 1
+            if last_page > 1:
+                workers = min(HCLOUD_FETCH_WORKERS, last_page - 1)
+                with ThreadPoolExecutor(max_workers=workers) as executor:
+                    for result in executor.map(self._get_servers_page, range(2, last_page + 1)):
+                        servers_list.extend(result.servers)
+            
             self.logger.info(f"Found {len(servers_list)} autoscaled servers from Hetzner")
+            
+            with servers_cache_lock:
+                _servers_cache['t'] = time.monotonic()
+                _servers_cache['data'] = servers_list
             return servers_list
         except Exception as e:
             self.logger.error(f"Failed to get servers from Hetzner: {e}")
@@ -138,8 +582,8 @@ class HetznerInventoryManager:
             self.logger.error(f"Error getting IP for {server.name}: {e}")
             return None
     
-    def generate_dynamic_inventory(self, static_hosts=None):
-        """Generate inventory with dynamic autoscaled nodes"""
+    def generate_dynamic_inventory(self, static_hosts=None, static_nodes=()):
+        """Generate inventory with dynamic autoscaled nodes, keeping `static_nodes` in kube_node"""
         if static_hosts is None:
             static_hosts = self._load_static_hosts()
         
@@ -157,14 +601,19 @@ class HetznerInventoryManager:
             }
         }
         
+        # Classify static hosts once and reuse the buckets for every group
+        buckets = _bucket_hosts(static_hosts)
+        
         # Add static groups
-        if 'kube_control_plane' in static_hosts or 'master' in str(static_hosts):
-            masters = [h for h in static_hosts.keys() if h.startswith('master-')]
+        masters = buckets['master']
+        if masters:
             inventory['all']['children']['kube_control_plane']['hosts'] = {m: None for m in masters}
             inventory['all']['children']['etcd']['hosts'] = {m: None for m in masters}
         
-        workers = [h for h in static_hosts.keys() if h.startswith('worker-')]
-        inventory['all']['children']['kube_node']['hosts'] = {w: None for w in workers}
+        kube_nodes = {w: None for w in buckets['worker']}
+        # Static hosts joined as nodes through /add-node (e.g. gpu-1) don't follow the worker naming
+        kube_nodes.update(dict.fromkeys(h for h in static_nodes if h in static_hosts))
+        inventory['all']['children']['kube_node']['hosts'] = kube_nodes
         
         # Add dynamic autoscaled nodes
         servers = self.get_autoscaled_servers()
@@ -174,13 +623,7 @@ class HetznerInventoryManager:
                 self.logger.warning(f"Skipping server {server.name}: no IP found")
                 continue
             
-            inventory['all']['hosts'][server.name] = {
-                'ansible_host': ip,
-                'ip': ip,
-                'access_ip': ip,
-                'ansible_user': 'root',
-                'ansible_shell_executable': '/bin/bash'
-            }
+            inventory['all']['hosts'][server.name] = _host_vars(ip)
             inventory['all']['children']['kube_node']['hosts'][server.name] = None
             self.logger.info(f"Added {server.name} ({ip}) to inventory")
         
@@ -189,16 +632,14 @@ class HetznerInventoryManager:
     def _load_static_hosts(self):
         """Load static hosts from current inventory"""
         try:
-            with open(INVENTORY_FILE, 'r') as f:
-                current = yaml.safe_load(f)
+            current = _read_inventory()
             
             static_hosts = {}
             current_hosts = current.get('all', {}).get('hosts', {})
             
             # Keep only non-apps hosts (masters, workers, bastion)
-            exclude_prefixes = ('apps-',)
             for hostname, hostdata in current_hosts.items():
-                if not any(hostname.startswith(p) for p in exclude_prefixes):
+                if _classify(hostname) != 'apps':
                     static_hosts[hostname] = hostdata
             
             return static_hosts
@@ -211,31 +652,110 @@ class HetznerInventoryManager:
         with inventory_lock:
             try:
                 static_hosts = self._load_static_hosts()
-                new_inventory = self.generate_dynamic_inventory(static_hosts)
+                current = _read_inventory()
+                kube_node = (current.get('all', {}).get('children') or {}).get('kube_node') or {}
+                new_inventory = self.generate_dynamic_inventory(static_hosts, kube_node.get('hosts') or {})
+                
+                if new_inventory == current:
+                    self.logger.info("Inventory already up to date with Hetzner, skipping write")
+                    return True
                 
                 # Write updated inventory
-                with open(INVENTORY_FILE, 'w') as f:
-                    yaml.dump(new_inventory, f, default_flow_style=False, sort_keys=False)
+                _write_inventory(new_inventory)
                 
                 self.logger.info(f"Synced inventory: {len(new_inventory['all']['hosts'])} total hosts, "
-                               f"{len([h for h in new_inventory['all']['hosts'] if h.startswith('apps-')])} autoscaled")
+                               f"{len(_bucket_hosts(new_inventory['all']['hosts'])['apps'])} autoscaled")
                 return True
             except Exception as e:
                 self.logger.error(f"Failed to sync inventory: {e}")
                 return False
 
 
+# Shared manager so the hcloud client's HTTPS connections are reused across syncs
+HETZNER_MANAGER = (
+    HetznerInventoryManager(HCLOUD_TOKEN, HCLOUD_NETWORK_ID)
+    if HCLOUD_TOKEN and HCLOUD_NETWORK_ID else None
+)
+
+
+def _tail_log(path, lines):
+    """Return the last `lines` lines of a file, reading backwards from EOF in chunks"""
+    if lines <= 0:
+        return []
+    
+    chunks = deque()
+    newlines = 0
+    with open(path, 'rb') as f:
+        pos = f.seek(0, os.SEEK_END)
+        # Read until one newline more than needed, so the first wanted line is complete
+        while pos > 0 and newlines <= lines:
+            size = min(LOG_TAIL_CHUNK, pos)
+            pos -= size
+            f.seek(pos)
+            chunk = f.read(size)
+            newlines += chunk.count(b'\n')
+            chunks.appendleft(chunk)
+    
+    tail = b''.join(chunks).splitlines()[-lines:]
+    return [line.decode('utf-8', errors='replace') for line in tail]
+
+
+# Suffixes of hosts.yaml.backup.* that the API itself creates: rotation indexes and old timestamped backups
+_ROTATED_BACKUP_RE = re.compile(r'^\d+$')
+_TIMESTAMPED_BACKUP_RE = re.compile(r'^\d{8}_\d{6}$')
+
+
+def _prune_stray_backups(backup_file):
+    """Trim surplus rotation indexes and old timestamped backups, keeping any other file"""
+    directory = os.path.dirname(backup_file)
+    prefix = os.path.basename(backup_file) + '.'
+    stale = []
+    timestamped = []
+    for name in os.listdir(directory):
+        if not name.startswith(prefix):
+            continue
+        suffix = name[len(prefix):]
+        path = os.path.join(directory, name)
+        if _ROTATED_BACKUP_RE.match(suffix) and int(suffix) > INVENTORY_BACKUP_COUNT:
+            stale.append(path)
+        elif _TIMESTAMPED_BACKUP_RE.match(suffix):
+            try:
+                timestamped.append((os.stat(path).st_mtime, path))
+            except FileNotFoundError:
+                pass
+    
+    timestamped.sort(reverse=True)
+    stale.extend(path for _, path in timestamped[INVENTORY_BACKUP_COUNT:])
+    for path in stale:
+        try:
+            os.remove(path)
+            logger.info(f"Removed stale inventory backup: {path}")
+        except OSError as e:
+            logger.warning(f"Failed to remove stale inventory backup {path}: {str(e)}")
+
+
 def backup_inventory():
-    """Create a backup of the inventory file"""
+    """Create a backup of the inventory file, rotating older ones like RotatingFileHandler"""
+    global _stray_backups_pruned
     try:
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        backup_file = f"{INVENTORY_FILE}.backup.{timestamp}"
+        backup_file = f"{INVENTORY_FILE}.backup"
         
-        with open(INVENTORY_FILE, 'r') as f:
-            content = f.read()
-        
-        with open(backup_file, 'w') as f:
-            f.write(content)
+        with backup_lock:
+            # The rotation keeps the directory bounded from then on, so one sweep per process is enough
+            if not _stray_backups_pruned:
+                _prune_stray_backups(backup_file)
+                _stray_backups_pruned = True
+            
+            # hosts.yaml.backup -> .backup.1 -> ... -> .backup.N, dropping the oldest
+            for i in range(INVENTORY_BACKUP_COUNT - 1, 0, -1):
+                src = f"{backup_file}.{i}"
+                if os.path.exists(src):
+                    os.replace(src, f"{backup_file}.{i + 1}")
+            if os.path.exists(backup_file):
+                os.replace(backup_file, f"{backup_file}.1")
+            
+            # copy_file_range/sendfile under the hood: the bytes never enter Python
+            shutil.copyfile(INVENTORY_FILE, backup_file)
         
         logger.info(f"Created inventory backup: {backup_file}")
         return backup_file
@@ -244,123 +764,618 @@ def backup_inventory():
         return None
 
 
+def _copy_for_edit(inventory):
+    """Copy the containers that add/remove edit, sharing everything else with the original"""
+    # Host entries stay shared with the cache: replace them, never mutate them
+    inventory = dict(inventory)
+    inventory['all'] = top = dict(inventory['all'])
+    top['hosts'] = dict(top['hosts'])
+    if isinstance(top.get('children'), dict):
+        top['children'] = children = dict(top['children'])
+        if isinstance(children.get('kube_node'), dict):
+            children['kube_node'] = kube_node = dict(children['kube_node'])
+            if isinstance(kube_node.get('hosts'), dict):
+                kube_node['hosts'] = dict(kube_node['hosts'])
+    return inventory
+
+
 def remove_from_inventory(hostname):
     """Remove a node from the Kubespray inventory file"""
-    with inventory_lock:
-        try:
-            backup_inventory()
+    try:
+        backed_up = False
+        while True:
+            with inventory_lock:
+                stat, current = _inventory_snapshot()
+                children = current['all'].get('children') or {}
+                kube_node_hosts = (children.get('kube_node') or {}).get('hosts') or {}
+                
+                # Nothing to do, so no backup and no write
+                if hostname not in current['all']['hosts'] and hostname not in kube_node_hosts:
+                    logger.warning(f"Node {hostname} not found in inventory")
+                    return False
+                
+                # Check if it's a master node (safety check)
+                if hostname in ((children.get('kube_control_plane') or {}).get('hosts') or {}):
+                    logger.error(f"Cannot remove master node {hostname}")
+                    return False
+                
+                # Work on a copy so a failed write leaves the cache intact
+                inventory = _copy_for_edit(current)
+                
+                # Remove from hosts
+                if hostname in inventory['all']['hosts']:
+                    del inventory['all']['hosts'][hostname]
+                    logger.info(f"Removed {hostname} from hosts")
+                
+                # Remove from kube_node group
+                if hostname in kube_node_hosts:
+                    del inventory['all']['children']['kube_node']['hosts'][hostname]
+                    logger.info(f"Removed {hostname} from kube_node group")
             
-            with open(INVENTORY_FILE, 'r') as f:
-                inventory = yaml.safe_load(f)
+            # The file is only ever replaced atomically, so this copy is consistent without the lock
+            if not backed_up:
+                backup_inventory()
+                backed_up = True
             
-            # Check if node exists
-            if hostname not in inventory['all']['hosts']:
-                logger.warning(f"Node {hostname} not found in inventory")
-                return False
+            # Serialize outside the lock, then publish only if nobody wrote in the meantime
+            tmp_file = _stage_inventory(inventory)
+            with inventory_lock:
+                if _publish_inventory(tmp_file, inventory, expected_stat=stat):
+                    break
+            logger.info(f"Inventory changed while removing {hostname}, retrying")
+        
+        logger.info(f"Successfully removed {hostname} from inventory")
+        return True
+    except Exception as e:
+        logger.error(f"Failed to remove from inventory: {str(e)}")
+        return False
+
+
+def add_to_inventory(nodes):
+    """Add nodes ({hostname: ip}) missing from the inventory as kube_node hosts and return the added hostnames"""
+    with inventory_lock:
+        try:
+            current = _read_inventory()
+            children = current['all'].get('children') or {}
+            control_plane_hosts = (children.get('kube_control_plane') or {}).get('hosts') or {}
+            kube_node_hosts = (children.get('kube_node') or {}).get('hosts') or {}
             
-            # Check if it's a master node (safety check)
-            if 'kube_control_plane' in inventory['all']['children']:
-                if 'hosts' in inventory['all']['children']['kube_control_plane']:
-                    if hostname in inventory['all']['children']['kube_control_plane']['hosts']:
-                        logger.error(f"Cannot remove master node {hostname}")
-                        return False
+            refused = [hostname for hostname in nodes if hostname in control_plane_hosts]
+            if refused:
+                logger.error(f"Cannot add master nodes as workers: {', '.join(refused)}")
+                return None
             
-            # Remove from hosts
-            del inventory['all']['hosts'][hostname]
-            logger.info(f"Removed {hostname} from hosts")
+            # No-op when every node is already present and grouped, so nothing is written
+            missing = {h: ip for h, ip in nodes.items() if h not in current['all']['hosts']}
+            ungrouped = [
+                h for h in nodes
+                if h in current['all']['hosts'] and h not in kube_node_hosts and _classify(h) == 'apps'
+            ]
+            if not missing and not ungrouped:
+                return []
             
-            # Remove from kube_node group
-            if 'kube_node' in inventory['all']['children']:
-                if 'hosts' in inventory['all']['children']['kube_node']:
-                    if hostname in inventory['all']['children']['kube_node']['hosts']:
-                        del inventory['all']['children']['kube_node']['hosts'][hostname]
-                        logger.info(f"Removed {hostname} from kube_node group")
+            # Work on a copy so a failed write leaves the cache intact
+            inventory = _copy_for_edit(current)
+            kube_node = inventory['all'].setdefault('children', {}).setdefault('kube_node', {})
+            if kube_node.get('hosts') is None:
+                kube_node['hosts'] = {}
             
-            # Write back to file
-            with open(INVENTORY_FILE, 'w') as f:
-                yaml.dump(inventory, f, default_flow_style=False, sort_keys=False)
+            for hostname, ip in missing.items():
+                inventory['all']['hosts'][hostname] = _host_vars(ip)
+                kube_node['hosts'][hostname] = None
+                logger.info(f"Added {hostname} ({ip}) to inventory")
+            for hostname in ungrouped:
+                kube_node['hosts'][hostname] = None
+                logger.info(f"Added {hostname} to kube_node group")
             
-            logger.info(f"Successfully removed {hostname} from inventory")
-            return True
+            _write_inventory(inventory)
+            return list(missing)
+        except Exception as e:
+            logger.error(f"Failed to add to inventory: {str(e)}")
+            return None
+
+
+def _drop_added_hosts(hostnames):
+    """Undo add_to_inventory() for hosts whose provisioning failed"""
+    with inventory_lock:
+        try:
+            current = _read_inventory()
+            inventory = _copy_for_edit(current)
+            kube_node_hosts = ((inventory['all'].get('children') or {}).get('kube_node') or {}).get('hosts') or {}
+            for hostname in hostnames:
+                inventory['all']['hosts'].pop(hostname, None)
+                kube_node_hosts.pop(hostname, None)
+            _write_inventory(inventory)
+            logger.info(f"Removed unprovisioned hosts from inventory: {', '.join(hostnames)}")
         except Exception as e:
-            logger.error(f"Failed to remove from inventory: {str(e)}")
-            return False
+            logger.error(f"Failed to remove unprovisioned hosts from inventory: {str(e)}")
 
 
-def run_ansible_playbook(hostname):
-    """Run Kubespray scale playbook for a specific node"""
+def run_ansible_playbook(nodes, output_path=None):
+    """Run Kubespray scale playbook for the given nodes ({hostname: ip}) and return (success, message, output tail)"""
+    limit = ','.join(nodes)
+    added = []
+    success = False
     try:
-        # First, sync inventory from Hetzner
-        if HCLOUD_TOKEN and HCLOUD_NETWORK_ID:
-            manager = HetznerInventoryManager(HCLOUD_TOKEN, HCLOUD_NETWORK_ID)
-            manager.sync_inventory()
+        # Nodes usually arrive via the periodic Hetzner sync already; only add the ones that didn't
+        added = add_to_inventory(nodes)
+        if added is None:
+            return False, "Failed to add nodes to inventory", ''
         
         cmd = [
             VENV_ANSIBLE,
             '-i', INVENTORY_FILE,
             SCALE_PLAYBOOK,
-            f'--limit={hostname}',
-            '-e', 'ansible_shell_executable=/bin/bash',
-            '-vvv'
+            f'--limit={limit}',
+            '-e', 'ansible_shell_executable=/bin/bash'
         ]
+        if ANSIBLE_VERBOSITY > 0:
+            cmd.append('-' + 'v' * ANSIBLE_VERBOSITY)
         
         logger.info(f"Running command: {' '.join(cmd)}")
         logger.info(f"DEBUG: ANSIBLE_SHELL_EXECUTABLE = /bin/bash")
         
-        result = subprocess.run(
+        # Stream output to the log instead of buffering it, keeping only the tail for errors
+        proc = subprocess.Popen(
             cmd,
-            capture_output=True,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
             text=True,
-            timeout=1800  # 30 minute timeout
+            encoding='utf-8',
+            errors='replace',  # A stray non-UTF-8 byte from a task must not end the run
+            bufsize=1,
+            env=_ANSIBLE_ENV,
+            start_new_session=True
         )
         
-        if result.returncode == 0:
-            logger.info(f"Successfully provisioned node {hostname}")
-            return True, "Node provisioned successfully"
+        timed_out = threading.Event()
+        
+        def kill_playbook():
+            # Kill the whole process group so ssh children don't keep the pipe open
+            try:
+                os.killpg(proc.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+        
+        def kill_on_timeout():
+            timed_out.set()
+            kill_playbook()
+        
+        killer = threading.Timer(ANSIBLE_TIMEOUT, kill_on_timeout)
+        killer.start()
+        tail = deque(maxlen=ANSIBLE_OUTPUT_TAIL_LINES)
+        out = None
+        try:
+            if output_path:
+                try:
+                    out = open(output_path, 'w', encoding='utf-8')
+                except OSError as e:
+                    logger.error(f"Failed to open playbook output file {output_path}: {str(e)}")
+            # The job's output file holds the full run; the API log only gets it when there is no such file
+            for line in proc.stdout:
+                if out:
+                    out.write(line)
+                line = line.rstrip()
+                if not out:
+                    logger.info(f"[ansible {limit}] {line}")
+                tail.append(line)
+            returncode = proc.wait()
+        finally:
+            killer.cancel()
+            if proc.poll() is None:
+                kill_playbook()
+                proc.wait()
+            proc.stdout.close()
+            if out:
+                out.close()
+        
+        if timed_out.is_set():
+            raise subprocess.TimeoutExpired(cmd, ANSIBLE_TIMEOUT)
+        
+        output = '\n'.join(tail)
+        if returncode == 0:
+            logger.info(f"Successfully provisioned {limit}")
+            success = True
+            return True, "Node provisioned successfully", output
         else:
-            error_msg = result.stderr or result.stdout or "Unknown error"
-            logger.error(f"Failed to provision {hostname}: {error_msg}")
-            return False, error_msg
+            logger.error(f"Failed to provision {limit}: ansible-playbook exited with code {returncode}")
+            return False, f"Ansible playbook failed with exit code {returncode}", output
     except subprocess.TimeoutExpired:
-        logger.error(f"Ansible playbook timed out for {hostname}")
-        return False, "Playbook execution timed out"
+        logger.error(f"Ansible playbook timed out for {limit}")
+        return False, "Playbook execution timed out", ''
     except Exception as e:
-        logger.error(f"Error running playbook for {hostname}: {str(e)}")
-        return False, str(e)
+        logger.error(f"Error running playbook for {limit}: {str(e)}")
+        return False, str(e), ''
+    finally:
+        # The sync never drops non-apps hosts, so a failed node would otherwise stay in kube_node for good
+        if not success and added:
+            _drop_added_hosts(added)
 
 
-def ansible_worker():
-    """Background worker that processes Ansible jobs from the queue"""
-    while True:
+def _k8s_core():
+    """Shared CoreV1Api client, or None to fall back to kubectl"""
+    if k8s_client is None:
+        return None
+    with k8s_core_lock:
+        if _k8s_core_cache['core'] is not None:
+            return _k8s_core_cache['core']
+        failed_at = _k8s_core_cache['failed_at']
+        if failed_at is not None and time.monotonic() - failed_at < K8S_CONFIG_RETRY:
+            return None
+        
         try:
-            job = ansible_queue.get(block=True)
-            
-            if job is None:  # Poison pill to stop worker
-                break
-            
-            job_id, hostname, ip = job
+            k8s_config.load_kube_config()
+        except Exception:
+            try:
+                k8s_config.load_incluster_config()
+            except Exception as e:
+                logger.warning(f"No Kubernetes config for the API client, using kubectl: {str(e)}")
+                _k8s_core_cache['failed_at'] = time.monotonic()
+                return None
+        _k8s_core_cache['core'] = k8s_client.CoreV1Api(k8s_client.ApiClient())
+        return _k8s_core_cache['core']
+
+
+def _kubectl_env(refresh=False):
+    """Environment for kubectl calls, with KUBECONFIG pointing at a minified, flattened config"""
+    with kubectl_env_lock:
+        resolved_at = _kubectl_env_cache['t']
+        if not refresh and resolved_at is not None and time.monotonic() - resolved_at < KUBECTL_KUBECONFIG_TTL:
+            return _kubectl_env_cache['env']
+        
+        env = None
+        tmp_file = None
+        try:
+            result = subprocess.run(
+                [KUBECTL, 'config', 'view', '--minify', '--flatten'],
+                capture_output=True,
+                text=True,
+                timeout=30
+            )
+            if result.returncode != 0:
+                raise RuntimeError(result.stderr.strip())
             
-            with job_lock:
+            # Holds credentials: mkstemp creates it exclusively with mode 0600, then it is swapped into place
+            fd, tmp_file = tempfile.mkstemp(dir=os.path.dirname(KUBECTL_KUBECONFIG), prefix='.kubeconfig.')
+            with os.fdopen(fd, 'w') as f:
+                f.write(result.stdout)
+            os.replace(tmp_file, KUBECTL_KUBECONFIG)
+            env = {**os.environ, 'KUBECONFIG': KUBECTL_KUBECONFIG}
+        except Exception as e:
+            logger.warning(f"Could not write minified kubeconfig, using the default one: {str(e)}")
+            if tmp_file:
+                try:
+                    os.remove(tmp_file)
+                except FileNotFoundError:
+                    pass
+        
+        _kubectl_env_cache['t'] = time.monotonic()
+        _kubectl_env_cache['env'] = env
+        return env
+
+
+def _run_kubectl(args, timeout):
+    """Run kubectl with the minified kubeconfig, re-resolving it once on an authentication error"""
+    cmd = [KUBECTL, *args, f'--request-timeout={KUBECTL_REQUEST_TIMEOUT}']
+    result = subprocess.run(cmd, capture_output=True, text=True, timeout=timeout, env=_kubectl_env())
+    if result.returncode != 0 and _KUBECTL_AUTH_ERROR_RE.search(result.stderr):
+        logger.info("kubectl authentication failed, refreshing the minified kubeconfig")
+        result = subprocess.run(cmd, capture_output=True, text=True, timeout=timeout, env=_kubectl_env(refresh=True))
+    return result
+
+
+def _get_node(core, hostname, max_age=NODE_CACHE_TTL):
+    """Read a node through the API client, reusing a read made within max_age seconds (None if missing)"""
+    now = time.monotonic()
+    with node_cache_lock:
+        # Entries are only useful for NODE_CACHE_TTL; drop the rest so removed nodes don't linger
+        for name in [name for name, (fetched_at, _) in _node_cache.items() if now - fetched_at >= NODE_CACHE_TTL]:
+            del _node_cache[name]
+        cached = _node_cache.get(hostname)
+    if cached and now - cached[0] < max_age:
+        return cached[1]
+    
+    try:
+        node = core.read_node(hostname, _request_timeout=K8S_REQUEST_TIMEOUT)
+    except ApiException as e:
+        if e.status != 404:
+            raise
+        node = None
+    with node_cache_lock:
+        _node_cache[hostname] = (now, node)
+    return node
+
+
+def check_node_status(hostname, max_age=NODE_CACHE_TTL):
+    """Get the Ready condition of a node from Kubernetes"""
+    try:
+        core = _k8s_core()
+        if core is not None:
+            node = _get_node(core, hostname, max_age)
+            if node is None:
+                return {'exists': False, 'ready': False, 'status': 'NotFound', 'reason': f'node "{hostname}" not found'}
+            for condition in node.status.conditions or []:
+                if condition.type == 'Ready':
+                    return {
+                        'exists': True,
+                        'ready': condition.status == 'True',
+                        'status': condition.status,
+                        'reason': condition.reason or ''
+                    }
+            return {'exists': True, 'ready': False, 'status': 'Unknown', 'reason': ''}
+        
+        result = _run_kubectl(['get', 'node', hostname, '-o', 'json'], timeout=30)
+        if result.returncode != 0:
+            return {'exists': False, 'ready': False, 'status': 'NotFound', 'reason': result.stderr.strip()}
+        
+        node = json.loads(result.stdout)
+        for condition in node.get('status', {}).get('conditions', []):
+            if condition.get('type') == 'Ready':
+                return {
+                    'exists': True,
+                    'ready': condition.get('status') == 'True',
+                    'status': condition.get('status'),
+                    'reason': condition.get('reason', '')
+                }
+        return {'exists': True, 'ready': False, 'status': 'Unknown', 'reason': ''}
+    except Exception as e:
+        logger.error(f"Error checking node status for {hostname}: {str(e)}")
+        return {'exists': False, 'ready': False, 'status': 'Error', 'reason': str(e)}
+
+
+def _wait_ready(hostnames, timeout=NODE_READY_TIMEOUT, interval=0.5, max_interval=4.0):
+    """Poll check_node_status with exponential backoff until the nodes are Ready or timeout expires"""
+    deadline = time.monotonic() + timeout
+    statuses = {}
+    waiting = list(hostnames)
+    while True:
+        # Polling needs a fresh read every time
+        for hostname in waiting:
+            statuses[hostname] = check_node_status(hostname, max_age=0)
+        waiting = [h for h in waiting if not statuses[h]['ready'] and statuses[h]['status'] != 'Error']
+        remaining = deadline - time.monotonic()
+        if not waiting or remaining <= 0:
+            return statuses
+        time.sleep(min(interval, remaining))
+        interval = min(interval * 2, max_interval)
+
+
+def _evict_pods(core, hostname):
+    """Cordon a node and evict its pods like kubectl drain, waiting up to DRAIN_TIMEOUT for them to go away"""
+    core.patch_node(hostname, {'spec': {'unschedulable': True}}, _request_timeout=K8S_REQUEST_TIMEOUT)
+    
+    pending = {}
+    for pod in core.list_pod_for_all_namespaces(
+        field_selector=f'spec.nodeName={hostname}', _request_timeout=K8S_REQUEST_TIMEOUT
+    ).items:
+        owners = pod.metadata.owner_references or []
+        if any(owner.kind == 'DaemonSet' for owner in owners):
+            continue
+        if 'kubernetes.io/config.mirror' in (pod.metadata.annotations or {}):
+            continue
+        pending[pod.metadata.uid] = (pod.metadata.namespace, pod.metadata.name)
+    
+    total = len(pending)
+    evicted = set()
+    deadline = time.monotonic() + DRAIN_TIMEOUT
+    while True:
+        for uid, (namespace, name) in pending.items():
+            if uid in evicted:
+                continue
+            body = k8s_client.V1Eviction(metadata=k8s_client.V1ObjectMeta(name=name, namespace=namespace))
+            try:
+                core.create_namespaced_pod_eviction(name, namespace, body, _request_timeout=K8S_REQUEST_TIMEOUT)
+                evicted.add(uid)
+            except ApiException as e:
+                if e.status == 404:
+                    evicted.add(uid)
+                elif e.status != 429:
+                    raise
+        
+        # Pods are gone once their UID no longer shows up on the node
+        remaining = {
+            pod.metadata.uid
+            for pod in core.list_pod_for_all_namespaces(
+                field_selector=f'spec.nodeName={hostname}', _request_timeout=K8S_REQUEST_TIMEOUT
+            ).items
+        }
+        pending = {uid: ref for uid, ref in pending.items() if uid in remaining}
+        if not pending:
+            return True, f"evicted {total} pods from {hostname}"
+        if time.monotonic() >= deadline:
+            names = ', '.join(f"{namespace}/{name}" for namespace, name in pending.values())
+            return False, f"timed out waiting for pods to be evicted: {names}"
+        time.sleep(1)
+
+
+def drain_and_delete_node(hostname):
+    """Drain a node and delete it from Kubernetes"""
+    result = {'exists': False, 'drained': False, 'deleted': False, 'drain_output': '', 'delete_output': ''}
+    
+    core = _k8s_core()
+    if core is None:
+        return _drain_and_delete_kubectl(hostname, result)
+    
+    # Any step may fail (API error, unreachable apiserver); carry on so the delete is still attempted
+    try:
+        node = _get_node(core, hostname)
+        if node is None:
+            logger.info(f"Node {hostname} not found in Kubernetes")
+            return result
+        result['exists'] = True
+    except Exception as e:
+        logger.error(f"Error reading node {hostname}: {str(e)}")
+        result['drain_output'] = str(e)
+    
+    # Delete even if the drain fails, the node is going away either way
+    try:
+        result['drained'], result['drain_output'] = _evict_pods(core, hostname)
+    except Exception as e:
+        result['drain_output'] = str(e)
+    if not result['drained']:
+        logger.warning(f"Drain of {hostname} incomplete: {result['drain_output']}")
+    
+    try:
+        core.delete_node(hostname, _request_timeout=K8S_REQUEST_TIMEOUT)
+        with node_cache_lock:
+            _node_cache.pop(hostname, None)
+        result['deleted'] = True
+        result['delete_output'] = f'node "{hostname}" deleted'
+    except Exception as e:
+        result['deleted'] = isinstance(e, ApiException) and e.status == 404
+        result['delete_output'] = str(e)
+    
+    logger.info(f"Kubernetes removal of {hostname}: drained={result['drained']} deleted={result['deleted']}")
+    return result
+
+
+def _drain_and_delete_kubectl(hostname, result):
+    """kubectl fallback for drain_and_delete_node when the Python client is unavailable"""
+    try:
+        if not check_node_status(hostname)['exists']:
+            logger.info(f"Node {hostname} not found in Kubernetes")
+            return result
+        result['exists'] = True
+        
+        drain = _run_kubectl(
+            ['drain', hostname, '--ignore-daemonsets', '--delete-emptydir-data', '--force', f'--timeout={DRAIN_TIMEOUT}s'],
+            timeout=DRAIN_TIMEOUT + 30
+        )
+        result['drained'] = drain.returncode == 0
+        result['drain_output'] = (drain.stdout + drain.stderr).strip()
+        
+        delete = _run_kubectl(['delete', 'node', hostname], timeout=60)
+        result['deleted'] = delete.returncode == 0
+        result['delete_output'] = (delete.stdout + delete.stderr).strip()
+    except Exception as e:
+        logger.error(f"Error removing {hostname} from Kubernetes: {str(e)}")
+        result['delete_output'] = str(e)
+    
+    logger.info(f"Kubernetes removal of {hostname}: drained={result['drained']} deleted={result['deleted']}")
+    return result
+
+
+def _job_output_path(job_id):
+    """Path of the file holding a job's playbook output"""
+    # job_id is built from request data, keep it to a safe file name
+    return os.path.join(JOB_LOG_DIR, re.sub(r'[^A-Za-z0-9_.-]', '_', job_id) + '.log')
+
+
+def _link_job_output(source, job_id):
+    """Share a batch's playbook output file with another job and return its path, or None on failure"""
+    path = _job_output_path(job_id)
+    try:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        try:
+            os.link(source, path)
+        except OSError:
+            shutil.copyfile(source, path)
+        return path
+    except Exception as e:
+        logger.error(f"Failed to write output for job {job_id}: {str(e)}")
+        return None
+
+
+def _prune_jobs():
+    """Drop finished jobs past JOB_TTL or beyond JOB_MAX and return their output files (caller holds job_lock)"""
+    stale_outputs = []
+    cutoff = time.monotonic() - JOB_TTL
+    while finished_jobs and (finished_jobs[0][0] < cutoff or len(jobs) > JOB_MAX):
+        finished_at, job_id = finished_jobs.popleft()
+        # Skip entries for jobs that were resubmitted since they finished
+        if job_id in jobs and jobs[job_id].get('finished_at') == finished_at:
+            output_file = jobs.pop(job_id).get('output_file')
+            if output_file:
+                stale_outputs.append(output_file)
+    return stale_outputs
+
+
+def _remove_job_outputs(paths):
+    """Delete output files of pruned jobs"""
+    for path in paths:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def run_ansible_batch():
+    """Run one playbook for up to ANSIBLE_BATCH_SIZE pending jobs"""
+    try:
+        with job_lock:
+            batch = pending_jobs[:ANSIBLE_BATCH_SIZE]
+            del pending_jobs[:ANSIBLE_BATCH_SIZE]
+            more = bool(pending_jobs)
+            for job_id, _, _ in batch:
                 if job_id in jobs:
                     jobs[job_id]['status'] = JobStatus.RUNNING
                     jobs[job_id]['message'] = 'Running Ansible playbook'
-            
-            success, message = run_ansible_playbook(hostname)
-            
+        
+        if more:
+            ansible_executor.submit(run_ansible_batch)
+        if not batch:
+            return
+        
+        job_ids = [job_id for job_id, _, _ in batch]
+        nodes = {hostname: ip for _, hostname, ip in batch}
+        
+        # The playbook streams its full output to the first job's file; the rest of the batch links to it
+        output_path = _job_output_path(job_ids[0])
+        # Unlink rather than truncate: an earlier batch may still share this file with other jobs
+        _remove_job_outputs([output_path])
+        success, message, _ = run_ansible_playbook(nodes, output_path)
+        
+        output_files = {}
+        if os.path.exists(output_path):
+            output_files[job_ids[0]] = output_path
+            for job_id in job_ids[1:]:
+                output_files[job_id] = _link_job_output(output_path, job_id)
+        
+        # Verify the nodes joined; return as soon as each one reports Ready
+        node_statuses = {}
+        if success:
             with job_lock:
+                for job_id in job_ids:
+                    if job_id in jobs:
+                        jobs[job_id]['message'] = 'Waiting for node to become Ready'
+            node_statuses = _wait_ready(nodes)
+        
+        with job_lock:
+            finished_at = time.monotonic()
+            for job_id, hostname, _ in batch:
                 if job_id in jobs:
                     jobs[job_id]['status'] = JobStatus.COMPLETED if success else JobStatus.FAILED
                     jobs[job_id]['message'] = message
-                    jobs[job_id]['completed_at'] = datetime.now().isoformat()
-            
-            logger.info(f"Ansible worker completed job {job_id}. Queue size: {ansible_queue.qsize()}")
-        except Exception as e:
-            logger.error(f"Error in ansible worker: {str(e)}")
+                    if hostname in node_statuses:
+                        node_status = node_statuses[hostname]
+                        jobs[job_id]['node_status'] = node_status
+                        if node_status['ready']:
+                            jobs[job_id]['message'] = f"Worker node {hostname} has successfully joined the cluster"
+                        else:
+                            jobs[job_id]['message'] = f"{message}, but node {hostname} is not Ready yet"
+                    jobs[job_id]['output_file'] = output_files.get(job_id)
+                    jobs[job_id]['completed_at'] = now_iso()
+                    jobs[job_id]['finished_at'] = finished_at
+                    finished_jobs.append((finished_at, job_id))
+            stale_outputs = _prune_jobs()
+            queue_size = len(pending_jobs)
+        
+        _remove_job_outputs(stale_outputs)
+        
+        if success:
+            HetznerInventoryManager.invalidate()
+        
+        logger.info(f"Ansible worker completed jobs {', '.join(job_ids)}. Queue size: {queue_size}")
+    except Exception as e:
+        logger.error(f"Error in ansible worker: {str(e)}")
 
 
 def periodic_inventory_sync():
     """Background worker that syncs inventory from Hetzner every 10 minutes"""
-    if not HCLOUD_TOKEN or not HCLOUD_NETWORK_ID:
+    if not HETZNER_MANAGER:
         logger.info("Hetzner integration not configured, skipping periodic sync")
         return
     
@@ -371,8 +1386,7 @@ def periodic_inventory_sync():
             time.sleep(600)  # Wait 10 minutes between syncs
             
             logger.info("Starting periodic inventory sync from Hetzner...")
-            manager = HetznerInventoryManager(HCLOUD_TOKEN, HCLOUD_NETWORK_ID)
-            success = manager.sync_inventory()
+            success = HETZNER_MANAGER.sync_inventory()
             
             if success:
                 logger.info("Periodic inventory sync completed successfully")
@@ -382,19 +1396,64 @@ def periodic_inventory_sync():
             logger.error(f"Error in periodic inventory sync: {str(e)}")
 
 
-# Start Ansible worker thread
-worker_thread = threading.Thread(target=ansible_worker, daemon=True)
-worker_thread.start()
+_background_lock = threading.Lock()
+_background_started = False
+
+
+def start_background_workers():
+    """Start the periodic sync thread, once per process"""
+    global _background_started
+    with _background_lock:
+        if _background_started:
+            return
+        
+        # Start periodic inventory sync thread
+        sync_thread = threading.Thread(target=periodic_inventory_sync, daemon=True)
+        sync_thread.start()
+        
+        _background_started = True
+
+
+start_background_workers()
+
+
+def _validate_node(hostname, ip):
+    """Return why a requested node can't be added, or None if it's acceptable"""
+    if not isinstance(hostname, str) or len(hostname) > 253 or not _HOSTNAME_RE.match(hostname):
+        return f'Invalid hostname: {hostname!r}'
+    if hostname in _RESERVED_HOSTNAMES or hostname in _inventory_groups(_read_inventory()):
+        return f'Hostname {hostname} is an inventory group name'
+    try:
+        ipaddress.ip_address(ip if isinstance(ip, str) else '')
+    except ValueError:
+        return f'Invalid ip: {ip!r}'
+    return None
 
-# Start periodic inventory sync thread
-sync_thread = threading.Thread(target=periodic_inventory_sync, daemon=True)
-sync_thread.start()
+
+def _inventory_groups(inventory):
+    """Names of all groups in the inventory"""
+    groups = set()
+    pending = [inventory.get('all') or {}]
+    while pending:
+        children = pending.pop().get('children') or {}
+        for name, group in children.items():
+            groups.add(name)
+            if isinstance(group, dict):
+                pending.append(group)
+    return groups
 
 
 @app.route('/health', methods=['GET'])
 def health():
     """Health check endpoint"""
-    return jsonify({'status': 'healthy', 'timestamp': datetime.now().isoformat()}), 200
+    global _health_cache
+    # Probes hit this every few seconds; the body only changes once a second, so skip JSON encoding
+    timestamp = now_iso()
+    cached = _health_cache
+    if cached[0] != timestamp:
+        cached = (timestamp, b'{"status":"healthy","timestamp":"%s"}' % timestamp.encode())
+        _health_cache = cached
+    return app.response_class(cached[1], status=200, mimetype='application/json')
 
 
 @app.route('/add-node', methods=['POST'])
@@ -402,39 +1461,55 @@ def add_node():
     """Add a new node to the cluster"""
     try:
         data = request.get_json()
+        if not isinstance(data, dict):
+            return jsonify({'error': 'Request body must be a JSON object'}), 400
         hostname = data.get('hostname')
         ip = data.get('ip')
         
         if not hostname or not ip:
             return jsonify({'error': 'Missing hostname or ip'}), 400
         
+        # Both end up in hosts.yaml and in --limit, where anything else could act as an Ansible pattern
+        error = _validate_node(hostname, ip)
+        if error:
+            return jsonify({'error': error}), 400
+        
         job_id = f"{hostname}_{ip}"
         
+        # Only decide and mutate under the lock; responses are built after releasing it
+        in_progress = False
         with job_lock:
             # Check if job already exists
-            if job_id in jobs:
-                existing = jobs[job_id]
-                if existing['status'] in [JobStatus.RUNNING, JobStatus.QUEUED]:
-                    return jsonify({
-                        'status': 'okay',
-                        'message': f'Job already in progress for {hostname}',
-                        'job_id': job_id,
-                        'queue_position': ansible_queue.qsize()
-                    }), 409
-            
-            # Create new job
-            jobs[job_id] = {
-                'status': JobStatus.QUEUED,
-                'hostname': hostname,
-                'ip': ip,
-                'created_at': datetime.now().isoformat(),
-                'message': 'Waiting for Ansible to process'
-            }
+            if job_id in jobs and jobs[job_id]['status'] in [JobStatus.RUNNING, JobStatus.QUEUED]:
+                in_progress = True
+                queue_position = len(pending_jobs)
+            else:
+                # Create new job
+                jobs[job_id] = {
+                    'status': JobStatus.QUEUED,
+                    'hostname': hostname,
+                    'ip': ip,
+                    'created_at': now_iso(),
+                    'message': 'Waiting for Ansible to process'
+                }
+                stale_outputs = _prune_jobs()
+                pending_jobs.append((job_id, hostname, ip))
+                queue_position = len(pending_jobs)
+        
+        if in_progress:
+            return jsonify({
+                'status': 'okay',
+                'message': f'Job already in progress for {hostname}',
+                'job_id': job_id,
+                'queue_position': queue_position
+            }), 409
         
-        # Queue the Ansible job
-        ansible_queue.put((job_id, hostname, ip))
+        _remove_job_outputs(stale_outputs)
+        
+        # The first pending job schedules a run; jobs arriving before it starts join its batch
+        if queue_position == 1:
+            ansible_executor.submit(run_ansible_batch)
         
-        queue_position = ansible_queue.qsize()
         logger.info(f"Queued job {job_id} to add node {hostname} ({ip}). Queue position: {queue_position}")
         
         return jsonify({
@@ -454,6 +1529,7 @@ def status():
     try:
         hostname = request.args.get('hostname')
         ip = request.args.get('ip')
+        verbose = request.args.get('verbose', 'false').lower() == 'true'
         
         if not hostname or not ip:
             return jsonify({'error': 'Missing hostname or ip'}), 400
@@ -461,48 +1537,101 @@ def status():
         job_id = f"{hostname}_{ip}"
         
         with job_lock:
-            if job_id not in jobs:
-                return jsonify({
-                    'status': 'unknown',
-                    'message': f'No job found for {hostname}',
-                    'job_id': job_id
-                }), 404
-            
-            job = jobs[job_id]
+            job = jobs.get(job_id)
+            if job is not None:
+                response = {
+                    'job_id': job_id,
+                    'status': job['status'],
+                    'message': job.get('message', ''),
+                    'created_at': job['created_at'],
+                    'completed_at': job.get('completed_at'),
+                    'node_status': job.get('node_status', {})
+                }
+                output_file = job.get('output_file')
+        
+        if job is None:
             return jsonify({
-                'job_id': job_id,
-                'status': job['status'],
-                'message': job.get('message', ''),
-                'created_at': job['created_at'],
-                'completed_at': job.get('completed_at')
-            }), 200
+                'status': 'unknown',
+                'message': f'No job found for {hostname}',
+                'job_id': job_id
+            }), 404
+        
+        # Playbook output lives on disk; only read its tail, and only when asked for
+        if verbose and output_file:
+            try:
+                response['ansible_output'] = '\n'.join(_tail_log(output_file, ANSIBLE_OUTPUT_TAIL_LINES))
+            except FileNotFoundError:
+                response['ansible_output'] = ''
+        
+        return jsonify(response), 200
     except Exception as e:
         logger.error(f"Error in /status: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
 
+@app.route('/jobs', methods=['GET'])
+def list_jobs():
+    """List all tracked node addition jobs"""
+    try:
+        # Snapshot under the lock, build the response after releasing it
+        with job_lock:
+            snapshot = list(jobs.items())
+        
+        return jsonify({
+            'jobs': [
+                {
+                    'job_id': job_id,
+                    'hostname': job['hostname'],
+                    'ip': job['ip'],
+                    'status': job['status'],
+                    'created_at': job['created_at'],
+                    'message': job.get('message', '')
+                }
+                for job_id, job in snapshot
+            ]
+        }), 200
+    except Exception as e:
+        logger.error(f"Error in /jobs: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+
 @app.route('/remove-node', methods=['DELETE'])
 def remove_node():
-    """Remove a node from inventory"""
+    """Drain and delete a node from Kubernetes, then remove it from inventory"""
     try:
         hostname = request.args.get('hostname')
+        ip = request.args.get('ip')
         skip_k8s = request.args.get('skip_k8s', 'false').lower() == 'true'
         
         if not hostname:
             return jsonify({'error': 'Missing hostname'}), 400
         
+        # Refuse control plane nodes before touching Kubernetes
+        children = _read_inventory()['all'].get('children') or {}
+        if hostname in ((children.get('kube_control_plane') or {}).get('hosts') or {}):
+            logger.error(f"Cannot remove master node {hostname}")
+            return jsonify({'error': f'Cannot remove master node {hostname}'}), 400
+        
+        result = {'hostname': hostname, 'ip': ip}
+        if not skip_k8s:
+            result['kubernetes'] = drain_and_delete_node(hostname)
+        
         # Remove from inventory
-        success = remove_from_inventory(hostname)
+        result['inventory'] = remove_from_inventory(hostname)
         
-        if success:
-            logger.info(f"Successfully removed {hostname} from inventory")
+        if result['inventory'] or result.get('kubernetes', {}).get('deleted'):
+            HetznerInventoryManager.invalidate()
+            logger.info(f"Successfully removed {hostname}")
             return jsonify({
                 'status': 'okay',
-                'message': f'Node {hostname} removed from inventory'
+                'message': f'Node {hostname} removed',
+                'job_id': f'remove_{hostname}_{ip}',
+                'result': result
             }), 200
         else:
             return jsonify({
-                'error': f'Failed to remove {hostname}'
+                'error': f'Failed to remove {hostname}',
+                'result': result
             }), 500
     except Exception as e:
         logger.error(f"Error in /remove-node: {str(e)}")
@@ -513,11 +1642,10 @@ def remove_node():
 def sync_inventory():
     """Manually trigger inventory sync from Hetzner"""
     try:
-        if not HCLOUD_TOKEN or not HCLOUD_NETWORK_ID:
+        if not HETZNER_MANAGER:
             return jsonify({'error': 'Hetzner integration not configured'}), 400
         
-        manager = HetznerInventoryManager(HCLOUD_TOKEN, HCLOUD_NETWORK_ID)
-        success = manager.sync_inventory()
+        success = HETZNER_MANAGER.sync_inventory()
         
         if success:
             return jsonify({
@@ -535,14 +1663,15 @@ def sync_inventory():
 def get_inventory():
     """Get current inventory"""
     try:
-        with open(INVENTORY_FILE, 'r') as f:
-            inventory = yaml.safe_load(f)
+        inventory = _read_inventory()
         
         # Count nodes by group
+        hosts = inventory.get('all', {}).get('hosts', {})
+        autoscaled = len(_bucket_hosts(hosts)['apps'])
         stats = {
-            'total_hosts': len(inventory.get('all', {}).get('hosts', {})),
-            'autoscaled_nodes': len([h for h in inventory.get('all', {}).get('hosts', {}) if h.startswith('apps-')]),
-            'static_nodes': len([h for h in inventory.get('all', {}).get('hosts', {}) if not h.startswith('apps-')]),
+            'total_hosts': len(hosts),
+            'autoscaled_nodes': autoscaled,
+            'static_nodes': len(hosts) - autoscaled,
         }
         
         return jsonify({
@@ -555,9 +1684,32 @@ def get_inventory():
         return jsonify({'error': str(e)}), 500
 
 
+@app.route('/logs', methods=['GET'])
+def get_logs():
+    """Get the most recent lines of the API log"""
+    try:
+        try:
+            lines = int(request.args.get('lines', 100))
+        except ValueError:
+            return jsonify({'error': 'lines must be an integer'}), 400
+        lines = max(0, min(lines, LOG_TAIL_MAX_LINES))
+        
+        log_lines = _tail_log(LOG_FILE, lines)
+        
+        return jsonify({
+            'log_file': LOG_FILE,
+            'returned_lines': len(log_lines),
+            'logs': '\n'.join(log_lines)
+        }), 200
+    except Exception as e:
+        logger.error(f"Error in /logs: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+
 if __name__ == '__main__':
     logger.info("Starting Kubespray Scale API with Dynamic Inventory")
     logger.info(f"Inventory file: {INVENTORY_FILE}")
-    logger.info(f"Hetzner integration: {'enabled' if HCLOUD_TOKEN else 'disabled'}")
+    logger.info(f"Hetzner integration: {'enabled' if HETZNER_MANAGER else 'disabled'}")
     
-    app.run(host='0.0.0.0', port=5000, debug=False)
+    # Development server; production runs under gunicorn (see kubespray-api.service)
+    app.run(host='0.0.0.0', port=5000, debug=False, threaded=True)
@@ -60,6 +60,14 @@ install_dependencies() {
     fi
     
     pip3 install -r "$INSTALL_DIR/requirements.txt"
+    
+    # The API parses and writes the inventory with libyaml when PyYAML was built with it
+    if python3 -c 'import yaml, sys; sys.exit(0 if yaml.__with_libyaml__ else 1)'; then
+        print_info "PyYAML is using libyaml"
+    else
+        print_warn "PyYAML was built without libyaml; inventory parsing will be slower"
+        print_warn "Fix with: apt-get install -y libyaml-dev && pip3 install --force-reinstall --no-binary pyyaml pyyaml"
+    fi
 }
 
 create_directories() {
@@ -118,7 +126,7 @@ User=root
 Group=root
 WorkingDirectory=/opt/kubespray-api
 Environment="PYTHONUNBUFFERED=1"
-ExecStart=/usr/bin/python3 /opt/kubespray-api/kubespray_scale_api.py
+ExecStart=/usr/bin/python3 -m gunicorn -w 1 -k gthread --threads 16 --timeout 120 -b 0.0.0.0:5000 kubespray_scale_api:app
 Restart=always
 RestartSec=10
 StandardOutput=journal
@@ -12,6 +12,7 @@ NC='\033[0m' # No Color
 # Configuration
 INSTALL_DIR="/opt/kubespray-api"
 LOG_DIR="/var/log/kubespray-api"
+STATE_DIR="/var/lib/kubespray-api"
 SERVICE_FILE="/etc/systemd/system/kubespray-api.service"
 
 # Functions
@@ -68,6 +69,7 @@ remove_files() {
     print_warn "This will remove the following:"
     echo "  - $INSTALL_DIR (API files)"
     echo "  - $LOG_DIR (log files)"
+    echo "  - $STATE_DIR (API state)"
     echo
     
     read -p "Do you want to remove these directories? [y/N] " -n 1 -r
@@ -82,6 +84,11 @@ remove_files() {
             print_info "Removing: $LOG_DIR"
             rm -rf "$LOG_DIR"
         fi
+        
+        if [ -d "$STATE_DIR" ]; then
+            print_info "Removing: $STATE_DIR"
+            rm -rf "$STATE_DIR"
+        fi
         print_info "Files removed"
     else
         print_info "Keeping installation files"
@@ -105,10 +112,11 @@ show_status() {
     print_info "Uninstallation complete!"
     echo
     
-    if [ -d "$INSTALL_DIR" ] || [ -d "$LOG_DIR" ] || [ -f "$SERVICE_FILE" ]; then
+    if [ -d "$INSTALL_DIR" ] || [ -d "$LOG_DIR" ] || [ -d "$STATE_DIR" ] || [ -f "$SERVICE_FILE" ]; then
         print_warn "Some files may still remain:"
         [ -d "$INSTALL_DIR" ] && echo "  - $INSTALL_DIR"
         [ -d "$LOG_DIR" ] && echo "  - $LOG_DIR"
+        [ -d "$STATE_DIR" ] && echo "  - $STATE_DIR"
         [ -f "$SERVICE_FILE" ] && echo "  - $SERVICE_FILE"
     else
         print_info "All components removed successfully"